@@ -7,8 +7,7 @@
 from abc import ABC, abstractmethod
 import argparse
 import os
-import random
-from typing import Deque, Dict, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 import gym
 import numpy as np
@@ -36,18 +35,6 @@ class BaseDistributedWorker(ABC):
     def synchronize(self, new_state_dict: Dict[str, np.ndarray]):
         pass
 
-    # pylint: disable=no-self-use
-    def _synchronize(self, network: Brain, new_state_dict: Dict[str, np.ndarray]):
-        """Copy parameters from numpy arrays."""
-        param_name_list = list(new_state_dict.keys())
-        for worker_named_param in network.named_parameters():
-            worker_param_name = worker_named_param[0]
-            if worker_param_name in param_name_list:
-                new_param = torch.FloatTensor(new_state_dict[worker_param_name]).to(
-                    self.device
-                )
-                worker_named_param[1].data.copy_(new_param)
-
 
 class DistributedWorker(BaseDistributedWorker):
     """Base class for all functioning RL workers.
@@ -58,7 +45,14 @@ class DistributedWorker(BaseDistributedWorker):
         env_info (ConfigDict): information about environment
         hyper_params (ConfigDict): algorithm hyperparameters
         device (torch.Device): device on which worker process runs
+        rng (np.random.Generator): worker local random generator
+        env_seed (int): random seed of worker local environment
         env (gym.ENV): gym environment
+        state_host (torch.Tensor): pinned staging buffer for uploading states
+        state_device (torch.Tensor): reusable state buffer on worker device
+        param_host (torch.Tensor): pinned staging buffer for uploading parameters
+        param_device (torch.Tensor): flat parameter buffer on worker device
+        param_copy_event (torch.cuda.Event): event marking end of last param upload
     """
 
     def __init__(
@@ -75,6 +69,15 @@ class DistributedWorker(BaseDistributedWorker):
         self.env_info = env_info
         self.hyper_params = hyper_params
         self.device = torch.device(device)
+        self.rng = np.random.default_rng(self.rank * 0x9E3779B97F4A7C15 & 0xFFFFFFFF)
+        self.env_seed = int(self.rng.integers(0, 1000))
+
+        # NOTE: state buffers are allocated lazily in the worker process
+        self.state_host = None
+        self.state_device = None
+        self.param_host = None
+        self.param_device = None
+        self.param_copy_event = None
 
         self._init_env()
 
@@ -89,9 +92,13 @@ class DistributedWorker(BaseDistributedWorker):
             self.env = gym.make(self.env_info.name)
             env_utils.set_env(self.env, self.args)
 
-        random.seed(self.rank)
-        env_seed = random.randint(0, 999)
-        set_random_seed(env_seed, self.env)
+        set_random_seed(self.env_seed, self.env)
+
+    def _init_inference(self):
+        """Prepare action selection once the worker runs in its own process.
+
+        Workers building unpicklable inference state (e.g. jit traces) override it.
+        """
 
     @abstractmethod
     def load_params(self, path: str):
@@ -104,6 +111,24 @@ class DistributedWorker(BaseDistributedWorker):
     def select_action(self, state: np.ndarray) -> np.ndarray:
         pass
 
+    def select_action_async(self, state: np.ndarray) -> Any:
+        """Start selecting an action, to be retrieved with get_action.
+
+        Workers able to overlap action selection with other work override this.
+        """
+        return self.select_action(state)
+
+    # pylint: disable=no-self-use
+    def prefetch_state(self, state: np.ndarray):
+        """Start preparing the state for the next select_action_async call.
+
+        Workers uploading states to a device may override this.
+        """
+
+    def get_action(self, action_handle: Any) -> np.ndarray:
+        """Return the action started by select_action_async."""
+        return action_handle
+
     @abstractmethod
     def step(self, action: np.ndarray) -> Tuple[np.ndarray, np.float64, bool, dict]:
         pass
@@ -117,11 +142,79 @@ class DistributedWorker(BaseDistributedWorker):
     def synchronize(self, new_state_dict: Dict[str, np.ndarray]):
         pass
 
-    @staticmethod
-    def _preprocess_state(state: np.ndarray, device: torch.device) -> torch.Tensor:
-        """Preprocess state so that actor selects an action."""
-        state = torch.FloatTensor(state).to(device)
-        return state
+    # pylint: disable=attribute-defined-outside-init
+    def _synchronize(self, network: Brain, new_state_dict: Dict[str, np.ndarray]):
+        """Copy parameters from numpy arrays.
+
+        Params are published in half precision by the learner. On gpu, they are
+        uploaded at once through a flat pinned buffer and cast on device.
+        """
+        worker_params, new_params = [], []
+        for worker_param_name, worker_param in network.named_parameters():
+            if worker_param_name in new_state_dict:
+                worker_params.append(worker_param)
+                new_params.append(new_state_dict[worker_param_name])
+
+        with torch.no_grad():
+            if self.device.type != "cuda":
+                for worker_param, new_param in zip(worker_params, new_params):
+                    worker_param.data.copy_(torch.from_numpy(new_param))
+                return
+
+            param_numels = [new_param.size for new_param in new_params]
+            total_numel = sum(param_numels)
+            if self.param_host is None or self.param_host.numel() != total_numel:
+                self.param_host = torch.empty(
+                    total_numel, dtype=torch.float16, pin_memory=True
+                )
+                self.param_device = torch.empty(
+                    total_numel, dtype=torch.float16, device=self.device
+                )
+
+            # don't overwrite pinned buffer while previous upload may read from it
+            if self.param_copy_event is not None:
+                self.param_copy_event.synchronize()
+            np.concatenate(
+                [new_param.ravel() for new_param in new_params],
+                out=self.param_host.numpy(),
+            )
+            self.param_device.copy_(self.param_host, non_blocking=True)
+            self.param_copy_event = torch.cuda.Event()
+            self.param_copy_event.record(torch.cuda.current_stream(self.device))
+            for worker_param, new_param in zip(
+                worker_params, self.param_device.split(param_numels)
+            ):
+                worker_param.data.copy_(new_param.view_as(worker_param))
+
+    def _init_state_buffers(self):
+        """Allocate reusable buffers for uploading states to worker device.
+
+        Atari frames are uploaded as uint8 and cast on device.
+        """
+        state_shape = self.env_info.observation_space.shape
+        state_dtype = torch.uint8 if self.env_info.is_atari else torch.float32
+        self.state_device = torch.empty(
+            state_shape, dtype=state_dtype, device=self.device
+        )
+        if self.device.type == "cuda":
+            self.state_host = torch.empty(
+                state_shape, dtype=state_dtype, pin_memory=True
+            )
+
+    def _preprocess_state(self, state: np.ndarray) -> torch.Tensor:
+        """Preprocess state so that actor selects an action.
+
+        The returned tensor may be a reused buffer, overwritten on the next call.
+        """
+        if self.state_device is None:
+            self._init_state_buffers()
+
+        if self.state_host is not None:
+            np.copyto(self.state_host.numpy(), state)
+            self.state_device.copy_(self.state_host, non_blocking=True)
+        else:
+            np.copyto(self.state_device.numpy(), state)
+        return self.state_device.float()
 
 
 class DistributedWorkerWrapper(BaseDistributedWorker):
@@ -158,13 +251,72 @@ class DistributedWorkerWrapper(BaseDistributedWorker):
     def run(self):
         pass
 
-    def preprocess_nstep(self, nstepqueue: Deque) -> Tuple[np.ndarray, ...]:
-        """Return n-step transition with discounted reward."""
-        discounted_reward = 0
-        _, _, _, last_state, done = nstepqueue[-1]
-        for transition in list(reversed(nstepqueue)):
-            state, action, reward, _, _ = transition
-            discounted_reward = reward + self.hyper_params.gamma * discounted_reward
-        nstep_data = (state, action, discounted_reward, last_state, done)
+    # pylint: disable=attribute-defined-outside-init
+    def _init_nstep_buffers(
+        self, n_step: int, state_shape: tuple, state_dtype: np.dtype
+    ):
+        """Allocate ring buffers holding the last n_step transitions."""
+        nstep_states = np.empty((n_step,) + state_shape, dtype=state_dtype)
+        self.nstep_buffers = (
+            nstep_states,
+            np.empty(n_step, dtype=np.int64),
+            np.empty(n_step, dtype=np.float32),
+            np.empty_like(nstep_states),
+            np.empty(n_step, dtype=np.uint8),
+        )
+        self.nstep_size = n_step
+        self.nstep_head = 0
+        self.nstep_filled = 0
+
+    def push_nstep_transition(
+        self, transition: Tuple[np.ndarray, ...], gamma_powers: np.ndarray
+    ) -> Optional[Tuple[np.ndarray, ...]]:
+        """Push transition to n-step ring buffers.
+
+        Return the n-step transition starting at the oldest stored transition
+        once the buffers are full, None otherwise.
+        """
+        n_step = self.nstep_size
+        for buffer, entry in zip(self.nstep_buffers, transition):
+            buffer[self.nstep_head] = entry
+        self.nstep_head = (self.nstep_head + 1) % n_step
+        self.nstep_filled = min(self.nstep_filled + 1, n_step)
+        if self.nstep_filled < n_step:
+            return None
+
+        return self.preprocess_nstep(*self.nstep_buffers, self.nstep_head, gamma_powers)
+
+    @staticmethod
+    def preprocess_nstep(
+        states: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        next_states: np.ndarray,
+        dones: np.ndarray,
+        head: int,
+        gamma_powers: np.ndarray,
+    ) -> Tuple[np.ndarray, ...]:
+        """Return n-step transition with discounted reward from ring buffers.
+
+        `head` indexes the oldest transition of the full ring buffers, and
+        `gamma_powers` holds the discount factor of each step.
+        The return is truncated at the first terminal transition.
+        """
+        n_step = len(rewards)
+        order = (head + np.arange(n_step)) % n_step
+        ordered_dones = dones[order]
+        last_idx = int(np.argmax(ordered_dones)) if ordered_dones.any() else n_step - 1
+
+        discounted_reward = float(
+            gamma_powers[: last_idx + 1] @ rewards[order[: last_idx + 1]]
+        )
+        last = order[last_idx]
+        nstep_data = (
+            states[head],
+            actions[head],
+            discounted_reward,
+            next_states[last],
+            dones[last],
+        )
 
         return nstep_data
@@ -4,6 +4,7 @@
 - Contact: chris.yoon@medipixel.io
 """
 
+from collections import OrderedDict
 from typing import Dict, List
 
 import numpy as np
@@ -74,7 +75,14 @@ class ApeXLearnerWrapper(DistributedLearnerWrapper):
         self.rep_socket.send(new_priors_id)
 
     def publish_params(self, update_step: int, np_state_dict: Dict[str, np.ndarray]):
-        """Broadcast updated params to all workers."""
+        """Broadcast updated params to all workers.
+
+        Float params are sent in half precision to halve the message size.
+        """
+        np_state_dict = OrderedDict(
+            (name, param.astype(np.float16) if param.dtype == np.float32 else param)
+            for name, param in np_state_dict.items()
+        )
         param_info = [update_step, np_state_dict]
         new_params_id = pa.serialize(param_info).to_buffer()
         self.pub_socket.send(new_params_id)
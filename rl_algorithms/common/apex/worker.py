@@ -4,7 +4,6 @@
 - Contact: chris.yoon@medipixel.io
 """
 import argparse
-from collections import deque
 from typing import Dict
 
 import numpy as np
@@ -27,6 +26,16 @@ class ApeXWorkerWrapper(DistributedWorkerWrapper):
         hyper_params (ConfigDict): worker hyper_params
         update_step (int): tracker for learner update step
         use_n_step (int): indication for using n-step transitions
+        gamma_powers (np.ndarray): discount factors for each step of n-step return
+        state (np.ndarray): current state of the ongoing episode
+        done (bool): whether the ongoing episode is finished
+        score (float): accumulated reward of the ongoing episode
+        action_handle (Any): pending action selection for the current state
+        state_shape (tuple): shape of env observation
+        state_dtype (np.dtype): dtype for storing observations
+        nstep_buffers (tuple): ring buffers of recent transitions for n-step returns
+        nstep_head (int): index of the oldest transition in n-step ring buffers
+        nstep_filled (int): number of transitions stored in n-step ring buffers
         sub_socket (zmq.Context): subscriber socket for receiving params from learner
         push_socket (zmq.Context): push socket for sending experience to global buffer
 
@@ -39,9 +48,27 @@ class ApeXWorkerWrapper(DistributedWorkerWrapper):
         self.update_step = 0
         self.hyper_params = self.worker.hyper_params
         self.use_n_step = self.hyper_params.n_step > 1
+        self.gamma_powers = (
+            self.hyper_params.gamma ** np.arange(self.hyper_params.n_step)
+        ).astype(np.float32)
         self.scores = dict()
 
+        self.state_shape = self.worker.env_info.observation_space.shape
+        self.state_dtype = np.uint8 if self.worker.env_info.is_atari else np.float32
+
+        # NOTE: an episode unfinished when the local buffer is full
+        # is resumed on the next call of collect_data
+        self.state = None
+        self.done = True
+        self.score = 0
+        self.action_handle = None
+        if self.use_n_step:
+            self._init_nstep_buffers(
+                self.hyper_params.n_step, self.state_shape, self.state_dtype
+            )
+
         self.worker._init_env()
+        self.worker._init_inference()
 
     # pylint: disable=attribute-defined-outside-init
     def init_communication(self):
@@ -81,56 +108,90 @@ class ApeXWorkerWrapper(DistributedWorkerWrapper):
             # Add new entry for scores dict
             self.scores[self.update_step] = []
 
-    def compute_priorities(self, experience: Dict[str, np.ndarray]):
-        """Compute priority values (TD error) of collected experience."""
-        return self.worker.compute_priorities(experience)
-
-    def collect_data(self) -> dict:
-        """Fill and return local buffer."""
-        local_memory = dict(states=[], actions=[], rewards=[], next_states=[], dones=[])
-        local_memory_keys = local_memory.keys()
-        if self.use_n_step:
-            nstep_queue = deque(maxlen=self.hyper_params.n_step)
-
-        while len(local_memory["states"]) < self.hyper_params.local_buffer_max_size:
-            state = self.worker.env.reset()
-            done = False
-            score = 0
-            num_steps = 0
-            while not done:
-                if self.args.worker_render:
-                    self.worker.env.render()
-                num_steps += 1
-                action = self.select_action(state)
-                next_state, reward, done, _ = self.step(action)
-                transition = (state, action, reward, next_state, int(done))
-                if self.use_n_step:
-                    nstep_queue.append(transition)
-                    if self.hyper_params.n_step == len(nstep_queue):
-                        nstep_exp = self.preprocess_nstep(nstep_queue)
-                        for entry, keys in zip(nstep_exp, local_memory_keys):
-                            local_memory[keys].append(entry)
-                else:
-                    for entry, keys in zip(transition, local_memory_keys):
-                        local_memory[keys].append(entry)
-
-                state = next_state
-                score += reward
-
-                self.recv_params_from_learner()
-
-            self.scores[self.update_step].append(score)
-
-            if self.args.worker_verbose:
-                print(
-                    f"[TRAIN] [Worker {self.worker.rank}] "
-                    + f"Update step: {self.update_step}, Score: {score}, "
-                    + f"Epsilon: {self.worker.epsilon:.5f}"
-                )
-
-        for key in local_memory_keys:
-            local_memory[key] = np.array(local_memory[key])
-
+    def record_episode(self, score: float):
+        """Record score of the finished episode."""
+        self.scores[self.update_step].append(score)
+
+        if self.args.worker_verbose:
+            print(
+                f"[TRAIN] [Worker {self.worker.rank}] "
+                + f"Update step: {self.update_step}, Score: {score}, "
+                + f"Epsilon: {self.worker.epsilon:.5f}"
+            )
+
+    def collect_data(self) -> Dict[str, np.ndarray]:
+        """Fill and return local buffer with initial priorities of experiences."""
+        buffer_size = self.hyper_params.local_buffer_max_size
+        states = np.empty((buffer_size,) + self.state_shape, dtype=self.state_dtype)
+        actions = np.empty(buffer_size, dtype=np.int64)
+        rewards = np.empty(buffer_size, dtype=np.float32)
+        next_states = np.empty_like(states)
+        dones = np.empty(buffer_size, dtype=np.uint8)
+
+        # NOTE: bind attributes used at every step to locals for the rollout loop
+        env = self.worker.env
+        select_action_async = self.worker.select_action_async
+        get_action = self.worker.get_action
+        prefetch_state = self.worker.prefetch_state
+        step = self.worker.step
+        recv_params_from_learner = self.recv_params_from_learner
+        worker_render = self.args.worker_render
+        use_n_step = self.use_n_step
+        push_nstep_transition = self.push_nstep_transition
+        gamma_powers = self.gamma_powers
+
+        state, done, score = self.state, self.done, self.score
+        action_handle = self.action_handle
+        idx = 0
+        while idx < buffer_size:
+            if done:
+                state = env.reset()
+                score = 0
+                action_handle = select_action_async(state)
+
+            if worker_render:
+                env.render()
+            action = get_action(action_handle)
+            next_state, reward, done, _ = step(action)
+            if not done:
+                # upload the next state in background while storing the transition
+                prefetch_state(next_state)
+            transition = (state, action, reward, next_state, int(done))
+            if use_n_step:
+                transition = push_nstep_transition(transition, gamma_powers)
+            if transition is not None:
+                (
+                    states[idx],
+                    actions[idx],
+                    rewards[idx],
+                    next_states[idx],
+                    dones[idx],
+                ) = transition
+                idx += 1
+
+            if not done:
+                # overlap action selection for the next state with the work below
+                action_handle = select_action_async(next_state)
+
+            state = next_state
+            score += reward
+
+            recv_params_from_learner()
+
+            if done:
+                self.record_episode(score)
+        self.state, self.done, self.score = state, done, score
+        self.action_handle = action_handle
+
+        local_memory = dict(
+            states=states,
+            actions=actions,
+            rewards=rewards,
+            next_states=next_states,
+            dones=dones,
+        )
+        # NOTE: ship transitions and their initial priorities as a single message
+        local_memory["priorities"] = self.worker.compute_priorities(local_memory)
         return local_memory
 
     def run(self) -> Dict[int, float]:
@@ -138,9 +199,7 @@ class ApeXWorkerWrapper(DistributedWorkerWrapper):
         self.scores[self.update_step] = []
         while self.update_step < self.args.max_update_step:
             experience = self.collect_data()
-            priority_values = self.compute_priorities(experience)
-            worker_data = [experience, priority_values]
-            self.send_data_to_buffer(worker_data)
+            self.send_data_to_buffer(experience)
 
         mean_scores_per_ep_step = self.compute_mean_scores(self.scores)
         return mean_scores_per_ep_step
@@ -189,8 +189,8 @@ class ApeXBufferWrapper(BufferWrapper):
             pass
 
         if received:
-            new_replay_data = pa.deserialize(new_replay_data_id)
-            experience, priorities = new_replay_data
+            experience = pa.deserialize(new_replay_data_id)
+            priorities = experience["priorities"]
             for idx in range(len(experience["states"])):
                 transition = (
                     experience["states"][idx],
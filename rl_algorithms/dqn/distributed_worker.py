@@ -6,7 +6,8 @@
 
 import argparse
 from collections import OrderedDict
-from typing import Dict, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple, Union
 
 import numpy as np
 import torch
@@ -26,6 +27,12 @@ class DQNWorker(DistributedWorker):
         head (ConfigDict): head configs for building network
         state_dict (ConfigDict): initial network state dict received form learner
         device (str): literal to indicate cpu/cuda use
+        sample_action (Callable): cached sampler of env action space
+        dqn (Brain): worker dqn
+        dqn_infer (torch.jit.ScriptModule): traced dqn used for action selection
+        infer_stream (torch.cuda.Stream): cuda stream for action selection
+        upload_executor (ThreadPoolExecutor): background thread for state uploads
+        prefetched (tuple): exploration draw and state upload for the next action
 
     """
 
@@ -52,15 +59,55 @@ class DQNWorker(DistributedWorker):
         self.max_epsilon = self.hyper_params.max_epsilon
         self.min_epsilon = self.hyper_params.min_epsilon
         self.epsilon = self.hyper_params.max_epsilon
+        self.epsilon_step = (
+            self.max_epsilon - self.min_epsilon
+        ) * self.hyper_params.epsilon_decay
 
         self._init_networks(state_dict)
 
+    # pylint: disable=attribute-defined-outside-init
+    def _init_env(self):
+        """Intialize worker local environment and cache its action sampler."""
+        DistributedWorker._init_env(self)
+        self.sample_action = self.env.action_space.sample
+
     # pylint: disable=attribute-defined-outside-init
     def _init_networks(self, state_dict: OrderedDict):
         """Initialize DQN policy with learner state dict."""
         self.dqn = Brain(self.backbone_cfg, self.head_cfg).to(self.device)
         self.dqn.load_state_dict(state_dict)
         self.dqn.eval()
+        # worker never trains dqn, so autograd never needs to track its params
+        for param in self.dqn.parameters():
+            param.requires_grad = False
+        # NOTE: traced in the worker process by _init_inference since ScriptModules
+        # can't be pickled when the worker is shipped to its remote actor
+        self.dqn_infer = None
+        self.infer_stream = None
+        self.upload_executor = None
+        self.prefetched = None
+
+    def _init_inference(self):
+        """Trace the DQN on a single dummy state for fast per-step inference.
+
+        Called at actor start-up, or on the first greedy action otherwise.
+        The traced module shares parameters with `self.dqn`, so in-place
+        synchronization with the learner is reflected in it.
+        """
+        if self.device.type == "cpu":
+            # NOTE: each worker actor is allotted a single cpu,
+            # so avoid oversubscribing cores with intra-op threads
+            torch.set_num_threads(1)
+
+        dummy_state = torch.zeros(
+            (1,) + self.env_info.observation_space.shape, device=self.device
+        )
+        with torch.no_grad():
+            self.dqn_infer = torch.jit.trace(self.dqn, dummy_state)
+            self.dqn_infer(dummy_state)  # warm up outside of the rollout loop
+
+        if self.device.type == "cuda":
+            self.infer_stream = torch.cuda.Stream(self.device)
 
     def load_params(self, path: str):
         """Load model and optimizer parameters."""
@@ -72,24 +119,69 @@ class DQNWorker(DistributedWorker):
 
     def select_action(self, state: np.ndarray) -> np.ndarray:
         """Select an action from the input space."""
+        return self.get_action(self.select_action_async(state))
+
+    def prefetch_state(self, state: np.ndarray):
+        """Upload the state for the next greedy action in a background thread."""
+        if self.device.type != "cuda":
+            return
+
+        explore, state_future = self._draw_exploration(), None
+        if not explore:
+            if self.upload_executor is None:
+                self.upload_executor = ThreadPoolExecutor(max_workers=1)
+            state_future = self.upload_executor.submit(self._preprocess_state, state)
+        self.prefetched = (explore, state_future)
+
+    def _draw_exploration(self) -> bool:
+        """Return whether epsilon greedy policy takes a random action."""
+        # NOTE: sample before the forward so host and device work don't interleave
+        return self.epsilon > self.rng.random()
+
+    def select_action_async(self, state: np.ndarray) -> Union[np.ndarray, torch.Tensor]:
+        """Start selecting an action, without waiting for the greedy forward."""
         # epsilon greedy policy
-        # pylint: disable=comparison-with-callable
-        if self.epsilon > np.random.random():
-            selected_action = np.array(self.env.action_space.sample())
+        state_future: Optional[Future] = None
+        if self.prefetched is not None:
+            explore, state_future = self.prefetched
+            self.prefetched = None
+        else:
+            explore = self._draw_exploration()
+
+        if explore:
+            # no state upload nor forward is needed for a random action
+            action_handle = np.int64(self.sample_action())
         else:
+            if self.dqn_infer is None:
+                self._init_inference()
             with torch.no_grad():
-                state = self._preprocess_state(state, self.device)
-                selected_action = self.dqn(state).argmax()
-            selected_action = selected_action.cpu().numpy()
+                if state_future is not None:
+                    state = state_future.result()
+                else:
+                    state = self._preprocess_state(state)
+                if self.infer_stream is not None:
+                    default_stream = torch.cuda.current_stream(self.device)
+                    self.infer_stream.wait_stream(default_stream)
+                    # state may be a temporary allocated on the default stream
+                    state.record_stream(self.infer_stream)
+                # cuda.stream is a no-op for None
+                with torch.cuda.stream(self.infer_stream):
+                    action_handle = self.dqn_infer(state.unsqueeze(0)).argmax(dim=-1)
 
         # Decay epsilon
-        self.epsilon = max(
-            self.epsilon
-            - (self.max_epsilon - self.min_epsilon) * self.hyper_params.epsilon_decay,
-            self.min_epsilon,
-        )
+        epsilon = self.epsilon - self.epsilon_step
+        self.epsilon = epsilon if epsilon > self.min_epsilon else self.min_epsilon
 
-        return selected_action
+        return action_handle
+
+    def get_action(self, action_handle: Union[np.ndarray, torch.Tensor]) -> np.ndarray:
+        """Wait for the action started by select_action_async and return it."""
+        if isinstance(action_handle, torch.Tensor):
+            if self.infer_stream is not None:
+                self.infer_stream.synchronize()
+            # only a single scalar is synchronized to host
+            action_handle = np.int64(int(action_handle))
+        return action_handle
 
     def step(self, action: np.ndarray) -> Tuple[np.ndarray, np.float64, bool, dict]:
         """Take an action and return the response of the env."""
@@ -97,26 +189,52 @@ class DQNWorker(DistributedWorker):
         return next_state, reward, done, info
 
     def compute_priorities(self, memory: Dict[str, np.ndarray]) -> np.ndarray:
-        """Compute initial priority values of experiences in local memory."""
-        states = torch.FloatTensor(memory["states"]).to(self.device)
-        actions = torch.FloatTensor(memory["actions"]).long().to(self.device)
-        rewards = torch.FloatTensor(memory["rewards"].reshape(-1, 1)).to(self.device)
-        next_states = torch.FloatTensor(memory["next_states"]).to(self.device)
-        dones = torch.FloatTensor(memory["dones"].reshape(-1, 1)).to(self.device)
-        memory_tensors = (states, actions, rewards, next_states, dones)
-
-        with torch.no_grad():
-            dq_loss_element_wise, _ = self.loss_fn(
-                self.dqn,
-                self.dqn,
-                memory_tensors,
-                self.hyper_params.gamma,
-                self.head_cfg,
+        """Compute initial priority values of experiences in local memory.
+
+        Experiences are processed in fixed-size batches to bound memory usage.
+        """
+        batch_size = self.hyper_params.batch_size
+        loss_for_prior = []
+        for start in range(0, len(memory["states"]), batch_size):
+            batch = slice(start, start + batch_size)
+            states = (
+                torch.from_numpy(memory["states"][batch])
+                .to(self.device, non_blocking=True)
+                .float()
+            )
+            actions = torch.from_numpy(
+                memory["actions"][batch].astype(np.int64, copy=False)
+            ).to(self.device, non_blocking=True)
+            rewards = torch.from_numpy(
+                memory["rewards"][batch].astype(np.float32, copy=False).reshape(-1, 1)
+            ).to(self.device, non_blocking=True)
+            next_states = (
+                torch.from_numpy(memory["next_states"][batch])
+                .to(self.device, non_blocking=True)
+                .float()
             )
-        loss_for_prior = dq_loss_element_wise.detach().cpu().numpy()
-        new_priorities = loss_for_prior + self.hyper_params.per_eps
+            dones = (
+                torch.from_numpy(memory["dones"][batch].reshape(-1, 1))
+                .to(self.device, non_blocking=True)
+                .float()
+            )
+            memory_tensors = (states, actions, rewards, next_states, dones)
+
+            with torch.no_grad():
+                dq_loss_element_wise, _ = self.loss_fn(
+                    self.dqn,
+                    self.dqn,
+                    memory_tensors,
+                    self.hyper_params.gamma,
+                    self.head_cfg,
+                )
+            loss_for_prior.append(dq_loss_element_wise.detach().cpu().numpy())
+        new_priorities = np.concatenate(loss_for_prior) + self.hyper_params.per_eps
         return new_priorities
 
     def synchronize(self, new_state_dict: Dict[str, np.ndarray]):
         """Synchronize worker dqn with learner dqn."""
+        if self.infer_stream is not None:
+            # don't overwrite params read by an ongoing forward
+            torch.cuda.current_stream(self.device).wait_stream(self.infer_stream)
         self._synchronize(self.dqn, new_state_dict)
@@ -0,0 +1,65 @@
+from collections import deque
+
+import numpy as np
+
+from rl_algorithms.common.abstract.distributed_worker import DistributedWorkerWrapper
+from rl_algorithms.common.helper_functions import get_n_step_info
+
+
+class NStepWrapper(DistributedWorkerWrapper):
+    """Minimal wrapper for testing n-step ring buffers."""
+
+    def init_communication(self):
+        pass
+
+    def collect_data(self):
+        pass
+
+    def run(self):
+        pass
+
+
+def check_nstep_ring_buffer(n_step: int, gamma: float, seed: int):
+    """Test that ring buffers give the same n-step transitions as deque."""
+    rng = np.random.default_rng(seed)
+    state_shape = (3,)
+    gamma_powers = (gamma ** np.arange(n_step)).astype(np.float32)
+
+    wrapper = NStepWrapper(None, None, None)
+    wrapper._init_nstep_buffers(n_step, state_shape, np.float32)
+    nstep_queue: deque = deque(maxlen=n_step)
+
+    for _ in range(500):
+        transition = (
+            rng.random(state_shape, dtype=np.float32),
+            int(rng.integers(4)),
+            float(rng.random()),
+            rng.random(state_shape, dtype=np.float32),
+            int(rng.random() < 0.2),
+        )
+        nstep_queue.append(transition)
+        nstep_data = wrapper.push_nstep_transition(transition, gamma_powers)
+
+        if len(nstep_queue) < n_step:
+            assert nstep_data is None
+            continue
+
+        state, action, reward, next_state, done = nstep_data
+        expected_reward, expected_next_state, expected_done = get_n_step_info(
+            nstep_queue, gamma
+        )
+        assert np.allclose(state, nstep_queue[0][0])
+        assert action == nstep_queue[0][1]
+        assert np.isclose(reward, expected_reward, atol=1e-5)
+        assert np.allclose(next_state, expected_next_state)
+        assert done == expected_done
+
+
+def test_nstep_ring_buffer():
+    """Test n-step ring buffers with several n-step sizes."""
+    for n_step in [2, 3, 5]:
+        check_nstep_ring_buffer(n_step, gamma=0.99, seed=n_step)
+
+
+if __name__ == "__main__":
+    test_nstep_ring_buffer()